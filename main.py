@@ -5,8 +5,8 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import os
 import random
-import matplotlib.pyplot as plt  
-import matplotlib.dates as mdates  
+import pyarrow.dataset as ds
+from replay import replay_daily_state
 
 # 设置页面配置
 st.set_page_config(
@@ -30,30 +30,111 @@ if not os.path.exists(data_dir):
     os.makedirs(data_dir)
     st.info(f"已创建{data_dir}文件夹用于存储股票数据")
 
-# 数据加载函数
-@st.cache_data
-def load_stock_data(file_path):
+# 数据加载函数：缓存键包含文件mtime，stockdata_update.py刷新数据后不会再读到陈旧缓存
+@st.cache_data(show_spinner=False)
+def load_stock_data(file_path, file_mtime=None):
     try:
-        df = pd.read_csv(file_path)
-        # 确保日期列存在且格式正确
-        if 'trade_date' in df.columns:
-            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-            df = df.sort_values('trade_date')
+        # 仅当Parquet缓存不旧于CSV源文件时才读缓存；CSV被刷新后重新解析并重写缓存
+        stem = os.path.splitext(file_path)[0]
+        parquet_path = stem + '.parquet'
+        csv_path = stem + '.csv'
+        if os.path.exists(parquet_path) and (
+                not os.path.exists(csv_path)
+                or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+            df = pd.read_parquet(parquet_path)
+            if df['trade_date'].dtype != np.int32:  # 兼容datetime64的旧缓存
+                df['trade_date'] = df['trade_date'].dt.strftime('%Y%m%d').astype(np.int32)
             return df
-        else:
-            st.error("'trade_date' not found")
-            return pd.DataFrame()
+        # trade_date保持int32的YYYYMMDD原样：列内存减半、int排序更快，
+        # 显示时用定宽切片/f-string格式化，全程不创建Timestamp对象
+        df = pd.read_csv(csv_path, dtype={'trade_date': 'int32'})
+        df = df.sort_values('trade_date')
+        # 首次解析CSV后写出Parquet缓存，后续加载跳过CSV解析
+        try:
+            df.to_parquet(parquet_path, engine='pyarrow', compression='zstd')
+        except Exception:
+            pass  # 写缓存失败不影响本次加载
+        return df
+    except (KeyError, ValueError):
+        st.error("'trade_date' not found")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error: {e}")
         return pd.DataFrame()
 
-@st.cache_data
+# 随机抽取模式的数据源：把stockdata目录下的全部Parquet映射成一个常驻的Arrow数据集，
+# 目录快照不变时st.cache_resource保证每个进程只构建一次；返回六位代码到分片的索引，
+# 抽取一只股票只需读取对应的内存映射分片，完全不经过CSV解析
+@st.cache_resource(max_entries=1)
+def load_stock_dataset(data_dir, dir_state):
+    parquet_files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith('.parquet')]
+    if not parquet_files:
+        return {}
+    dataset = ds.dataset(parquet_files, format='parquet')
+    return {os.path.splitext(os.path.basename(frag.path))[0]: frag
+            for frag in dataset.get_fragments()}
+
+@st.cache_data(ttl=60)
 def get_available_stocks(data_dir):
     if not os.path.exists(data_dir):
         return []
     
-    stock_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
-    return stock_files
+    files = os.listdir(data_dir)
+    # Parquet优先；同名股票只列出一次
+    stock_files = [f for f in files if f.endswith('.parquet')]
+    cached = {os.path.splitext(f)[0] for f in stock_files}
+    stock_files += [f for f in files if f.endswith('.csv') and os.path.splitext(f)[0] not in cached]
+    return sorted(stock_files)
+
+def stockdata_dir_state(data_dir):
+    """(文件名, mtime)快照，作为整包缓存的键：stockdata_update.py刷新数据后键随之变化"""
+    return tuple((f, os.path.getmtime(os.path.join(data_dir, f)))
+                 for f in get_available_stocks(data_dir))
+
+# 手动选择模式的数据源：整个stockdata目录一次性读入常驻字典（目录快照不变时只做一次），
+# CSV走pyarrow的多线程解析器吃满磁盘带宽，之后选股只是一次字典查找；
+# max_entries=1：数据刷新换了快照键后立即淘汰旧的整包字典，内存不随刷新次数增长
+@st.cache_resource(max_entries=1)
+def load_all_stocks(data_dir, dir_state):
+    from pyarrow import csv as pacsv
+    stocks = {}
+    for file_name in get_available_stocks(data_dir):
+        file_path = os.path.join(data_dir, file_name)
+        try:
+            # 与load_stock_data相同的新鲜度判断：CSV比Parquet缓存新时重新解析
+            stem = os.path.splitext(file_path)[0]
+            parquet_path = stem + '.parquet'
+            csv_path = stem + '.csv'
+            if os.path.exists(parquet_path) and (
+                    not os.path.exists(csv_path)
+                    or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+                df = pd.read_parquet(parquet_path)
+                if df['trade_date'].dtype != np.int32:  # 兼容datetime64的旧缓存
+                    df['trade_date'] = df['trade_date'].dt.strftime('%Y%m%d').astype(np.int32)
+            else:
+                df = pacsv.read_csv(csv_path).to_pandas()
+                df['trade_date'] = df['trade_date'].astype(np.int32)
+                df = df.sort_values('trade_date')
+            stocks[os.path.splitext(file_name)[0]] = df
+        except Exception:
+            continue  # 个别损坏文件不阻塞整体加载
+    return stocks
+
+def format_trade_date(yyyymmdd):
+    """int32形式的YYYYMMDD → 'YYYY-MM-DD'，纯整数运算，不经过Timestamp对象"""
+    d = int(yyyymmdd)
+    return f'{d // 10000}-{(d // 100) % 100:02d}-{d % 100:02d}'
+
+# 交易记录的定长dtype：SoA打包存储，追加无每行dict/Python对象，序列化为连续字节
+TRADE_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('type', 'u1'),          # 0=买入 1=卖出
+    ('stock_code', 'U16'),
+    ('price', 'f8'),
+    ('amount', 'i4'),
+    ('total', 'f8'),         # 买入为总成本，卖出为总收入
+])
+TRADE_TYPE_LABELS = np.array(['买入', '卖出'])
 
 # 交易模拟器类
 class StockTrader:
@@ -63,8 +144,21 @@ class StockTrader:
         self.capital = initial_capital          # 当前资金
         self.shares = 0                         # 持有的股票数量
         self.commission_rate = commission_rate  # 交易费率
-        self.trade_history = []                 # 交易历史
-        self.daily_state = []                   # 每日状态记录
+        # 交易历史用定长dtype的recarray打包存储，满时倍增扩容
+        self._trades = np.empty(256, dtype=TRADE_DTYPE)
+        self._trade_n = 0                       # 已记录交易条数
+        self.buy_count = 0                      # 买入次数（避免每次rerun扫描交易历史）
+        self._trade_df_cache = pd.DataFrame()   # 上次构建的交易历史DataFrame
+        self._trade_df_len = 0                  # 该缓存覆盖的交易条数
+        self._daily_df_cache = pd.DataFrame()   # 上次构建的每日状态DataFrame
+        self._daily_df_n = 0                    # 该缓存覆盖的天数
+        # 每日状态用SoA列数组存储：数值列预分配ndarray、满时倍增扩容，
+        # 代替list-of-dict，追加无dict分配，收益列可整段向量化重算
+        self._dates = []                        # 日期字符串
+        self._prices = np.empty(1024, dtype=np.float64)
+        self._capitals = np.empty(1024, dtype=np.float64)
+        self._shares = np.empty(1024, dtype=np.float64)
+        self._n = 0                             # 已记录天数
         
     def buy(self, date, price, amount, stock_code):
         """买入股票"""
@@ -75,15 +169,8 @@ class StockTrader:
         
         self.capital -= total_cost
         self.shares += amount
-        
-        self.trade_history.append({
-            'date': date,
-            'type': '买入',
-            'stock_code': stock_code,
-            'price': price,
-            'amount': amount,
-            'total_cost': total_cost
-        })
+        self.buy_count += 1
+        self._append_trade(date, 0, stock_code, price, amount, total_cost)
         
         return True, f"买入成功: {amount}股，价格: {price}元，总成本: {total_cost:.2f}元"
     
@@ -96,34 +183,57 @@ class StockTrader:
         
         self.capital += total_income
         self.shares -= amount
-        
-        self.trade_history.append({
-            'date': date,
-            'type': '卖出',
-            'stock_code': stock_code,
-            'price': price,
-            'amount': amount,
-            'total_income': total_income
-        })
+        self._append_trade(date, 1, stock_code, price, amount, total_income)
         
         return True, f"卖出成功: {amount}股，价格: {price}元，总收入: {total_income:.2f}元"
     
+    def _append_trade(self, date, trade_type, stock_code, price, amount, total):
+        """向recarray缓冲区追加一条交易记录"""
+        if self._trade_n == self._trades.size:
+            new_buf = np.empty(self._trades.size * 2, dtype=TRADE_DTYPE)
+            new_buf[:self._trade_n] = self._trades[:self._trade_n]
+            self._trades = new_buf
+        self._trades[self._trade_n] = (np.datetime64(date), trade_type, stock_code, price, amount, total)
+        self._trade_n += 1
+    
+    def serialize_trades(self):
+        """交易记录序列化为msgpack字节串：连续缓冲区直接打包，不经过逐行Python对象"""
+        import msgpack
+        return msgpack.packb({'n': int(self._trade_n),
+                              'data': self._trades[:self._trade_n].tobytes()})
+    
+    def load_trades(self, payload):
+        """从serialize_trades的输出恢复交易记录"""
+        import msgpack
+        state = msgpack.unpackb(payload)
+        self._trades = np.frombuffer(state['data'], dtype=TRADE_DTYPE).copy()
+        self._trade_n = state['n']
+        self.buy_count = int((self._trades['type'][:self._trade_n] == 0).sum())
+        self._trade_df_len = 0  # 使DataFrame缓存失效
+    
+    def _grow_daily_buffers(self):
+        """数值缓冲区倍增扩容"""
+        for name in ('_prices', '_capitals', '_shares'):
+            buf = getattr(self, name)
+            new_buf = np.empty(buf.size * 2, dtype=np.float64)
+            new_buf[:self._n] = buf[:self._n]
+            setattr(self, name, new_buf)
+    
     def record_daily_state(self, date, price):
         """记录每日状态"""
+        if self._n == self._prices.size:
+            self._grow_daily_buffers()
+        n = self._n
+        self._dates.append(date)
+        self._prices[n] = price
+        self._capitals[n] = self.capital
+        self._shares[n] = self.shares
+        self._n = n + 1
+        
         portfolio_value = self.capital + self.shares * price
-        daily_return = 0 if not self.daily_state else (price / self.daily_state[-1]['price'] - 1) * 100
+        daily_return = 0 if n == 0 else (price / self._prices[n - 1] - 1) * 100
         cumulative_return = (portfolio_value / self.initial_capital - 1) * 100
         
-        self.daily_state.append({
-            'date': date,
-            'price': price,
-            'capital': self.capital,
-            'shares': self.shares,
-            'portfolio_value': portfolio_value,
-            'daily_return': daily_return,
-            'cumulative_return': cumulative_return
-        })
-        
         return daily_return, cumulative_return
     
     def get_current_portfolio_value(self, current_price):
@@ -131,21 +241,62 @@ class StockTrader:
         return self.capital + self.shares * current_price
     
     def get_trade_history_df(self):
-        """获取交易历史DataFrame"""
-        return pd.DataFrame(self.trade_history)
+        """获取交易历史DataFrame（条数没变时直接返回缓存，变化时由recarray整段构建）"""
+        n = self._trade_n
+        if n == 0:
+            return pd.DataFrame()
+        if n != self._trade_df_len:
+            trades = self._trades[:n]
+            self._trade_df_cache = pd.DataFrame({
+                'date': trades['date'],
+                'type': TRADE_TYPE_LABELS[trades['type']],
+                'stock_code': trades['stock_code'],
+                'price': trades['price'],
+                'amount': trades['amount'],
+                'total': trades['total'],
+            })
+            self._trade_df_len = n
+        return self._trade_df_cache
     
     def get_daily_state_df(self):
-        """获取每日状态DataFrame"""
-        return pd.DataFrame(self.daily_state)
+        """获取每日状态DataFrame（天数没变时直接返回缓存，只在前进交易日后重建）"""
+        n = self._n
+        if n == 0:
+            return pd.DataFrame()
+        if n == self._daily_df_n:
+            return self._daily_df_cache
+        prices = self._prices[:n]
+        portfolio_value = self._capitals[:n] + self._shares[:n] * prices
+        daily_return = np.zeros(n)
+        daily_return[1:] = np.diff(prices) / prices[:-1] * 100
+        cumulative_return = (portfolio_value / self.initial_capital - 1) * 100
+        self._daily_df_cache = pd.DataFrame({
+            'date': self._dates,
+            'price': prices,
+            'capital': self._capitals[:n],
+            'shares': self._shares[:n],
+            'portfolio_value': portfolio_value,
+            'daily_return': daily_return,
+            'cumulative_return': cumulative_return
+        })
+        self._daily_df_n = n
+        return self._daily_df_cache
+    
+    def replay_from_history(self):
+        """批量重算整段每日状态（向前跳多日时用，调用JIT编译的单遍循环）"""
+        n = self._n
+        return replay_daily_state(
+            self._prices[:n], self._capitals[:n], self._shares[:n],
+            float(self.initial_capital))
     
     def has_buy_transaction(self):
         """检查是否有买入交易"""
-        for trade in self.trade_history:
-            if trade['type'] == '买入':
-                return True
-        return False
+        return self.buy_count > 0
 
 # 绘制动态K线图
+# 图形构建结果按(窗口索引, 当前日, 股票)缓存：窗口不变的rerun直接复用已序列化的JSON spec，
+# 服务端不再重建Figure；DataFrame按对象身份参与缓存键（同一份加载数据在session内不变）
+@st.cache_data(hash_funcs={pd.DataFrame: id})
 def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selected_stock=None):
     """使用Plotly绘制动态K线图（修复非交易日中断问题，兼容旧版本Plotly）"""
     # 切片数据
@@ -157,9 +308,13 @@ def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selecte
     # 计算每天涨跌情况
     plot_data['is_increasing'] = plot_data['close'] >= plot_data['open']
     
+    # int32的YYYYMMDD定宽，切片拼接成'YYYY-MM-DD'，整列无Timestamp对象
+    digits = plot_data['trade_date'].astype(str)
+    plot_data['date_str'] = digits.str[:4] + '-' + digits.str[4:6] + '-' + digits.str[6:]
+    
     # 生成K线图悬停文本
     plot_data['hover_text'] = (
-        '日期: ' + plot_data['trade_date'].dt.strftime('%Y-%m-%d') + '<br>' +
+        '日期: ' + plot_data['date_str'] + '<br>' +
         '开盘: ' + plot_data['open'].apply(lambda x: f'{x:.2f}') + '<br>' +
         '最高: ' + plot_data['high'].apply(lambda x: f'{x:.2f}') + '<br>' +
         '最低: ' + plot_data['low'].apply(lambda x: f'{x:.2f}') + '<br>' +
@@ -183,8 +338,8 @@ def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selecte
     ))
     
     # 分离上涨和下跌的成交量数据
-    increasing_vol = plot_data[plot_data['is_increasing']][['trading_day_index', 'vol', 'trade_date']]
-    decreasing_vol = plot_data[~plot_data['is_increasing']][['trading_day_index', 'vol', 'trade_date']]
+    increasing_vol = plot_data[plot_data['is_increasing']][['trading_day_index', 'vol', 'date_str']]
+    decreasing_vol = plot_data[~plot_data['is_increasing']][['trading_day_index', 'vol', 'date_str']]
     
     # 设置子图布局，K线图占8/9高度，成交量图占1/9高度
     fig.update_layout(
@@ -202,7 +357,7 @@ def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selecte
             domain=[0, 1],
             anchor='y2',
             tickvals=plot_data['trading_day_index'],
-            ticktext=plot_data['trade_date'].dt.strftime('%Y-%m-%d'),
+            ticktext=plot_data['date_str'],
             tickangle=0
         ),
         yaxis2=dict(
@@ -219,7 +374,7 @@ def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selecte
     # 添加上涨成交量柱状图（绿色）并设置悬停文本
     if not increasing_vol.empty:
         increasing_vol['vol_hover_text'] = (
-            '日期: ' + increasing_vol['trade_date'].dt.strftime('%Y-%m-%d') + '<br>' +
+            '日期: ' + increasing_vol['date_str'] + '<br>' +
             '成交量: ' + increasing_vol['vol'].apply(lambda x: f'{x}')
         )
         fig.add_trace(go.Bar(
@@ -235,7 +390,7 @@ def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selecte
     # 添加下跌成交量柱状图（红色）并设置悬停文本
     if not decreasing_vol.empty:
         decreasing_vol['vol_hover_text'] = (
-            '日期: ' + decreasing_vol['trade_date'].dt.strftime('%Y-%m-%d') + '<br>' +
+            '日期: ' + decreasing_vol['date_str'] + '<br>' +
             '成交量: ' + decreasing_vol['vol'].apply(lambda x: f'{x}')
         )
         fig.add_trace(go.Bar(
@@ -251,7 +406,7 @@ def plot_dynamic_candlestick(df, start_idx, end_idx, highlight_idx=None, selecte
     # 自定义x轴标签，显示实际日期
     fig.update_xaxes(
         tickvals=plot_data['trading_day_index'],
-        ticktext=plot_data['trade_date'].dt.strftime('%Y-%m-%d'),
+        ticktext=plot_data['date_str'],
         tickangle=0
     )
     
@@ -309,19 +464,17 @@ def main():
                 if uploaded_file is not None:
                     # 直接加载上传的文件，不保存到磁盘
                     try:
-                        df = pd.read_csv(uploaded_file)
-                        if 'trade_date' in df.columns:
-                            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-                            df = df.sort_values('trade_date')
-                            st.session_state.stock_data = df
-                            st.session_state.stock_data_loaded = True
-                            file_name = uploaded_file.name
-                            st.session_state.selected_file = file_name
-                            st.session_state.selected_stock_loaded = os.path.splitext(file_name)[0]
-                            st.session_state.max_data_length = len(df)
-                            st.success("数据加载成功！")
-                        else:
-                            st.error("数据文件中未找到'trade_date'列")
+                        df = pd.read_csv(uploaded_file, dtype={'trade_date': 'int32'})
+                        df = df.sort_values('trade_date')
+                        st.session_state.stock_data = df
+                        st.session_state.stock_data_loaded = True
+                        file_name = uploaded_file.name
+                        st.session_state.selected_file = file_name
+                        st.session_state.selected_stock_loaded = os.path.splitext(file_name)[0]
+                        st.session_state.max_data_length = len(df)
+                        st.success("数据加载成功！")
+                    except (KeyError, ValueError):
+                        st.error("数据文件中未找到'trade_date'列")
                     except Exception as e:
                         st.error(f"文件加载失败: {e}")
             else:
@@ -329,8 +482,9 @@ def main():
                 selected_file = st.selectbox("选择股票数据文件", available_stocks)
                 
                 if st.button("加载选中的股票"):
-                    file_path = os.path.join(data_dir, selected_file)
-                    stock_data = load_stock_data(file_path)
+                    # 全目录数据已常驻内存，选股只是一次字典查找
+                    all_stocks = load_all_stocks(data_dir, stockdata_dir_state(data_dir))
+                    stock_data = all_stocks.get(os.path.splitext(selected_file)[0], pd.DataFrame())
                     if not stock_data.empty:
                         st.session_state.stock_data = stock_data
                         st.session_state.stock_data_loaded = True
@@ -349,14 +503,22 @@ def main():
                 st.error(f"在{data_dir}文件夹中未找到CSV文件，请先手动导入股票数据")
             else:
                 if st.button("随机选择股票"):
-                    # 随机抽取一个文件
-                    selected_file = random.choice(available_stocks)
-                    selected_stock = os.path.splitext(selected_file)[0]
-                    st.info(f"已随机选择: {selected_stock}")
-                    
-                    # 自动加载随机选择的文件
-                    file_path = os.path.join(data_dir, selected_file)
-                    stock_data = load_stock_data(file_path)
+                    fragments = load_stock_dataset(data_dir, stockdata_dir_state(data_dir))
+                    if fragments:
+                        # 从常驻Arrow数据集中抽取一个分片直接转DataFrame
+                        selected_stock = random.choice(list(fragments))
+                        selected_file = selected_stock + '.parquet'
+                        st.info(f"已随机选择: {selected_stock}")
+                        stock_data = fragments[selected_stock].to_table().to_pandas()
+                        if stock_data['trade_date'].dtype != np.int32:  # 兼容datetime64的旧缓存
+                            stock_data['trade_date'] = stock_data['trade_date'].dt.strftime('%Y%m%d').astype(np.int32)
+                    else:
+                        # 目录里还没有Parquet时退回到普通加载
+                        selected_file = random.choice(available_stocks)
+                        selected_stock = os.path.splitext(selected_file)[0]
+                        st.info(f"已随机选择: {selected_stock}")
+                        file_path = os.path.join(data_dir, selected_file)
+                        stock_data = load_stock_data(file_path, os.path.getmtime(file_path))
                     if not stock_data.empty:
                         st.session_state.stock_data = stock_data
                         st.session_state.selected_file = selected_file
@@ -397,15 +559,22 @@ def main():
             # 交易费率
             commission_rate = st.slider("交易费率(%)", min_value=0.01, max_value=0.3, value=0.03, step=0.01) / 100
             
-            # 初始化交易模拟器
-            if 'trader' not in st.session_state:
-                st.session_state.trader = StockTrader(initial_capital, commission_rate)
+            # 初始化交易模拟器：按参数键重建——参数没变的rerun不碰trader，
+            # 参数变了但已开始交易时也不重建（否则滑杆抖动会悄悄清空交易历史）
+            trader_key = (initial_capital, commission_rate)
+            if st.session_state.get('trader_key') != trader_key:
+                if 'trader' not in st.session_state or not st.session_state.trader.has_buy_transaction():
+                    st.session_state.trader = StockTrader(initial_capital, commission_rate)
+                    st.session_state.last_recorded_day = None  # 新模拟器重新记录当日状态
+                st.session_state.trader_key = trader_key
             
             # 重置按钮
             if st.button("重置模拟器"):
                 st.session_state.trader = StockTrader(initial_capital, commission_rate)
                 st.session_state.data_loaded_range = (0, 100)
                 st.session_state.buy_executed = False  # 重置买入标记
+                st.session_state.trader_key = (initial_capital, commission_rate)
+                st.session_state.last_recorded_day = None  # 让重置后的第一天重新记录
                 st.success("模拟器已重置")
     
     # 主界面逻辑 (仅在数据加载后显示)
@@ -433,7 +602,7 @@ def main():
         # 获取当前日期数据
         if current_day < total_days:
             current_data = stock_data.iloc[current_day]
-            current_date = current_data['trade_date'].strftime('%Y-%m-%d')
+            current_date = format_trade_date(current_data['trade_date'])
             current_price = current_data['close']
         else:
             current_date = "数据已结束"
@@ -444,13 +613,19 @@ def main():
         col1.metric("当前日期", current_date)
         col1.metric("当前价格", f"{current_price:.2f}元")
         
-        # 记录每日状态
+        # 记录每日状态（只在交易日前进时追加一条；普通控件触发的rerun直接复用上次指标，
+        # 否则daily_state会被每次rerun无限追加，累积收益曲线也会被污染）
         if current_day < total_days:
-            daily_return, cumulative_return = st.session_state.trader.record_daily_state(
-                current_date, current_price
-            )
-            col2.metric("当日收益率", f"{daily_return:.2f}%")
-            col2.metric("累积收益率", f"{cumulative_return:.2f}%")
+            record_key = (selected_stock, current_day)
+            if st.session_state.get('last_recorded_day') != record_key:
+                daily_return, cumulative_return = st.session_state.trader.record_daily_state(
+                    current_date, current_price
+                )
+                st.session_state.last_recorded_day = record_key
+                st.session_state.last_daily_return = daily_return
+                st.session_state.last_cumulative_return = cumulative_return
+            col2.metric("当日收益率", f"{st.session_state.last_daily_return:.2f}%")
+            col2.metric("累积收益率", f"{st.session_state.last_cumulative_return:.2f}%")
             
             current_value = st.session_state.trader.get_current_portfolio_value(current_price)
             col3.metric("当前总资产", f"{current_value:.2f}元")
@@ -587,15 +762,9 @@ def main():
         st.subheader("每日收益曲线")
         daily_state_df = st.session_state.trader.get_daily_state_df()
         if not daily_state_df.empty:
-            fig, ax = plt.subplots(figsize=(12, 6))
-            ax.plot(daily_state_df['date'], daily_state_df['cumulative_return'], 'b-', label='累积收益率')
-            ax.set_xlabel('日期')
-            ax.set_ylabel('收益率 (%)')
-            ax.set_title('累积收益率曲线')
-            ax.grid(True, linestyle='--', alpha=0.7)
-            ax.legend()
-            plt.xticks(rotation=45)
-            st.pyplot(fig)
+            # 数据直接交给浏览器端的Vega渲染，服务端不再画图、编码PNG
+            st.line_chart(daily_state_df.set_index('date')[['cumulative_return']],
+                          use_container_width=True)
         else:
             st.info("暂无收益数据")
     else:
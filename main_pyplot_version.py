@@ -3,9 +3,11 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection, PolyCollection
 from datetime import datetime, timedelta
 import os
 import random
+from replay import njit, replay_daily_state
 
 
 # 设置页面配置
@@ -30,30 +32,64 @@ if not os.path.exists(data_dir):
     os.makedirs(data_dir)
     st.info(f"已创建{data_dir}文件夹用于存储股票数据")
 
-# 数据加载函数
-@st.cache_data
-def load_stock_data(file_path):
+# 数据加载函数：缓存键包含文件mtime，stockdata_update.py刷新数据后不会再读到陈旧缓存
+@st.cache_data(show_spinner=False)
+def load_stock_data(file_path, file_mtime=None):
     try:
-        df = pd.read_csv(file_path)
-        # 确保日期列存在且格式正确
-        if 'trade_date' in df.columns:
-            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-            df = df.sort_values('trade_date')
+        # 仅当Parquet缓存不旧于CSV源文件时才读缓存；CSV被刷新后重新解析并重写缓存
+        stem = os.path.splitext(file_path)[0]
+        parquet_path = stem + '.parquet'
+        csv_path = stem + '.csv'
+        if os.path.exists(parquet_path) and (
+                not os.path.exists(csv_path)
+                or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+            df = pd.read_parquet(parquet_path)
+            if df['trade_date'].dtype != np.int32:  # 兼容datetime64的旧缓存
+                df['trade_date'] = df['trade_date'].dt.strftime('%Y%m%d').astype(np.int32)
+            if '_mdate' not in df.columns:  # 兼容未带_mdate列的旧缓存
+                df['_mdate'] = mdates.date2num(pd.to_datetime(df['trade_date'], format='%Y%m%d').values)
             return df
-        else:
-            st.error("'trade_date' not found")
-            return pd.DataFrame()
+        # trade_date保持int32的YYYYMMDD原样：列内存减半、int排序更快，
+        # 显示时用定宽f-string格式化，全程不创建Timestamp对象
+        df = pd.read_csv(csv_path, dtype={'trade_date': 'int32'})
+        df = df.sort_values('trade_date')
+        # matplotlib日期浮点数只在加载时算一次，datetime只是临时中间值、不落列
+        df['_mdate'] = mdates.date2num(pd.to_datetime(df['trade_date'], format='%Y%m%d').values)
+        # 首次解析CSV后写出Parquet缓存，后续加载跳过CSV解析
+        try:
+            df.to_parquet(parquet_path, engine='pyarrow', compression='zstd')
+        except Exception:
+            pass  # 写缓存失败不影响本次加载
+        return df
+    except (KeyError, ValueError):
+        st.error("'trade_date' not found")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error: {e}")
         return pd.DataFrame()
 
-@st.cache_data
+@st.cache_data(ttl=60)
 def get_available_stocks(data_dir):
     if not os.path.exists(data_dir):
         return []
     
-    stock_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
-    return stock_files
+    files = os.listdir(data_dir)
+    # Parquet优先；同名股票只列出一次
+    stock_files = [f for f in files if f.endswith('.parquet')]
+    cached = {os.path.splitext(f)[0] for f in stock_files}
+    stock_files += [f for f in files if f.endswith('.csv') and os.path.splitext(f)[0] not in cached]
+    return sorted(stock_files)
+
+# 交易记录的定长dtype：SoA打包存储，追加无每行dict/Python对象，序列化为连续字节
+TRADE_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('type', 'u1'),          # 0=买入 1=卖出
+    ('stock_code', 'U16'),
+    ('price', 'f8'),
+    ('amount', 'i4'),
+    ('total', 'f8'),         # 买入为总成本，卖出为总收入
+])
+TRADE_TYPE_LABELS = np.array(['买入', '卖出'])
 
 # 交易模拟器类
 class StockTrader:
@@ -63,8 +99,21 @@ class StockTrader:
         self.capital = initial_capital          # 当前资金
         self.shares = 0                         # 持有的股票数量
         self.commission_rate = commission_rate  # 交易费率
-        self.trade_history = []                 # 交易历史
-        self.daily_state = []                   # 每日状态记录
+        # 交易历史用定长dtype的recarray打包存储，满时倍增扩容
+        self._trades = np.empty(256, dtype=TRADE_DTYPE)
+        self._trade_n = 0                       # 已记录交易条数
+        self.buy_count = 0                      # 买入次数（避免每次rerun扫描交易历史）
+        self._trade_df_cache = pd.DataFrame()   # 上次构建的交易历史DataFrame
+        self._trade_df_len = 0                  # 该缓存覆盖的交易条数
+        self._daily_df_cache = pd.DataFrame()   # 上次构建的每日状态DataFrame
+        self._daily_df_n = 0                    # 该缓存覆盖的天数
+        # 每日状态用SoA列数组存储：数值列预分配ndarray、满时倍增扩容，
+        # 代替list-of-dict，追加无dict分配，收益列可整段向量化重算
+        self._dates = []                        # 日期字符串
+        self._prices = np.empty(1024, dtype=np.float64)
+        self._capitals = np.empty(1024, dtype=np.float64)
+        self._shares = np.empty(1024, dtype=np.float64)
+        self._n = 0                             # 已记录天数
         
     def buy(self, date, price, amount, stock_code):
         """买入股票"""
@@ -75,15 +124,8 @@ class StockTrader:
         
         self.capital -= total_cost
         self.shares += amount
-        
-        self.trade_history.append({
-            'date': date,
-            'type': '买入',
-            'stock_code': stock_code,
-            'price': price,
-            'amount': amount,
-            'total_cost': total_cost
-        })
+        self.buy_count += 1
+        self._append_trade(date, 0, stock_code, price, amount, total_cost)
         
         return True, f"买入成功: {amount}股，价格: {price}元，总成本: {total_cost:.2f}元"
     
@@ -96,34 +138,57 @@ class StockTrader:
         
         self.capital += total_income
         self.shares -= amount
-        
-        self.trade_history.append({
-            'date': date,
-            'type': '卖出',
-            'stock_code': stock_code,
-            'price': price,
-            'amount': amount,
-            'total_income': total_income
-        })
+        self._append_trade(date, 1, stock_code, price, amount, total_income)
         
         return True, f"卖出成功: {amount}股，价格: {price}元，总收入: {total_income:.2f}元"
     
+    def _append_trade(self, date, trade_type, stock_code, price, amount, total):
+        """向recarray缓冲区追加一条交易记录"""
+        if self._trade_n == self._trades.size:
+            new_buf = np.empty(self._trades.size * 2, dtype=TRADE_DTYPE)
+            new_buf[:self._trade_n] = self._trades[:self._trade_n]
+            self._trades = new_buf
+        self._trades[self._trade_n] = (np.datetime64(date), trade_type, stock_code, price, amount, total)
+        self._trade_n += 1
+    
+    def serialize_trades(self):
+        """交易记录序列化为msgpack字节串：连续缓冲区直接打包，不经过逐行Python对象"""
+        import msgpack
+        return msgpack.packb({'n': int(self._trade_n),
+                              'data': self._trades[:self._trade_n].tobytes()})
+    
+    def load_trades(self, payload):
+        """从serialize_trades的输出恢复交易记录"""
+        import msgpack
+        state = msgpack.unpackb(payload)
+        self._trades = np.frombuffer(state['data'], dtype=TRADE_DTYPE).copy()
+        self._trade_n = state['n']
+        self.buy_count = int((self._trades['type'][:self._trade_n] == 0).sum())
+        self._trade_df_len = 0  # 使DataFrame缓存失效
+    
+    def _grow_daily_buffers(self):
+        """数值缓冲区倍增扩容"""
+        for name in ('_prices', '_capitals', '_shares'):
+            buf = getattr(self, name)
+            new_buf = np.empty(buf.size * 2, dtype=np.float64)
+            new_buf[:self._n] = buf[:self._n]
+            setattr(self, name, new_buf)
+    
     def record_daily_state(self, date, price):
         """记录每日状态"""
+        if self._n == self._prices.size:
+            self._grow_daily_buffers()
+        n = self._n
+        self._dates.append(date)
+        self._prices[n] = price
+        self._capitals[n] = self.capital
+        self._shares[n] = self.shares
+        self._n = n + 1
+        
         portfolio_value = self.capital + self.shares * price
-        daily_return = 0 if not self.daily_state else (price / self.daily_state[-1]['price'] - 1) * 100
+        daily_return = 0 if n == 0 else (price / self._prices[n - 1] - 1) * 100
         cumulative_return = (portfolio_value / self.initial_capital - 1) * 100
         
-        self.daily_state.append({
-            'date': date,
-            'price': price,
-            'capital': self.capital,
-            'shares': self.shares,
-            'portfolio_value': portfolio_value,
-            'daily_return': daily_return,
-            'cumulative_return': cumulative_return
-        })
-        
         return daily_return, cumulative_return
     
     def get_current_portfolio_value(self, current_price):
@@ -131,57 +196,135 @@ class StockTrader:
         return self.capital + self.shares * current_price
     
     def get_trade_history_df(self):
-        """获取交易历史DataFrame"""
-        return pd.DataFrame(self.trade_history)
+        """获取交易历史DataFrame（条数没变时直接返回缓存，变化时由recarray整段构建）"""
+        n = self._trade_n
+        if n == 0:
+            return pd.DataFrame()
+        if n != self._trade_df_len:
+            trades = self._trades[:n]
+            self._trade_df_cache = pd.DataFrame({
+                'date': trades['date'],
+                'type': TRADE_TYPE_LABELS[trades['type']],
+                'stock_code': trades['stock_code'],
+                'price': trades['price'],
+                'amount': trades['amount'],
+                'total': trades['total'],
+            })
+            self._trade_df_len = n
+        return self._trade_df_cache
     
     def get_daily_state_df(self):
-        """获取每日状态DataFrame"""
-        return pd.DataFrame(self.daily_state)
+        """获取每日状态DataFrame（天数没变时直接返回缓存，只在前进交易日后重建）"""
+        n = self._n
+        if n == 0:
+            return pd.DataFrame()
+        if n == self._daily_df_n:
+            return self._daily_df_cache
+        prices = self._prices[:n]
+        portfolio_value = self._capitals[:n] + self._shares[:n] * prices
+        daily_return = np.zeros(n)
+        daily_return[1:] = np.diff(prices) / prices[:-1] * 100
+        cumulative_return = (portfolio_value / self.initial_capital - 1) * 100
+        self._daily_df_cache = pd.DataFrame({
+            'date': self._dates,
+            'price': prices,
+            'capital': self._capitals[:n],
+            'shares': self._shares[:n],
+            'portfolio_value': portfolio_value,
+            'daily_return': daily_return,
+            'cumulative_return': cumulative_return
+        })
+        self._daily_df_n = n
+        return self._daily_df_cache
+    
+    def replay_from_history(self):
+        """批量重算整段每日状态（向前跳多日时用，调用JIT编译的单遍循环）"""
+        n = self._n
+        return replay_daily_state(
+            self._prices[:n], self._capitals[:n], self._shares[:n],
+            float(self.initial_capital))
     
     def has_buy_transaction(self):
         """检查是否有买入交易"""
-        for trade in self.trade_history:
-            if trade['type'] == '买入':
-                return True
-        return False
+        return self.buy_count > 0
+
+def format_trade_date(yyyymmdd):
+    """int32形式的YYYYMMDD → 'YYYY-MM-DD'，纯整数运算，不经过Timestamp对象"""
+    d = int(yyyymmdd)
+    return f'{d // 10000}-{(d // 100) % 100:02d}-{d % 100:02d}'
+
+# K线配色：uint8打包的RGBA常量（绿涨红跌），按涨跌掩码一次广播出整窗颜色数组
+GREEN_RGBA = np.array([0, 128, 0, 255], dtype=np.uint8)
+RED_RGBA = np.array([255, 0, 0, 255], dtype=np.uint8)
+
+@njit(cache=True)
+def _build_candle_arrays(dates, opens, closes, highs, lows):
+    """单遍循环产出影线线段、实体四边形顶点和涨跌掩码（JIT编译，无中间Python对象）"""
+    n = dates.shape[0]
+    wicks = np.empty((n, 2, 2))
+    bodies = np.empty((n, 4, 2))
+    up = np.empty(n, np.bool_)
+    for i in range(n):
+        d = dates[i]
+        wicks[i, 0, 0] = d
+        wicks[i, 0, 1] = lows[i]
+        wicks[i, 1, 0] = d
+        wicks[i, 1, 1] = highs[i]
+        bodies[i, 0, 0] = d - 0.3  # 实体宽度0.6，即日期±0.3
+        bodies[i, 0, 1] = opens[i]
+        bodies[i, 1, 0] = d - 0.3
+        bodies[i, 1, 1] = closes[i]
+        bodies[i, 2, 0] = d + 0.3
+        bodies[i, 2, 1] = closes[i]
+        bodies[i, 3, 0] = d + 0.3
+        bodies[i, 3, 1] = opens[i]
+        up[i] = closes[i] >= opens[i]
+    return wicks, bodies, up
 
 # 绘制K线图
-def plot_candlestick(df, start_idx, end_idx, highlight_idx=None):
-    """绘制K线图"""
+def plot_candlestick(cols, start_idx, end_idx, highlight_idx=None):
+    """绘制K线图（向量化实现，整窗口只创建两个Collection，避免逐行bar/vlines）
+
+    cols是加载时缓存好的NumPy列数组字典，窗口切片是零拷贝视图，
+    不经过DataFrame.iloc（省去BlockManager索引和Index构建）。
+    """
     fig, ax = plt.subplots(figsize=(14, 7))  # 增大图表尺寸以便查看更多数据
-    
-    # 切片数据
-    plot_data = df.iloc[start_idx:end_idx]
-    
-    # 绘制K线
-    for i, row in plot_data.iterrows():
-        date = mdates.date2num(row['trade_date'])
-        open_price = row['open']
-        close_price = row['close']
-        high_price = row['high']
-        low_price = row['low']
-        
-        # 上涨为绿色，下跌为红色
-        color = 'g' if close_price >= open_price else 'r'
-        
-        # 绘制实体
-        ax.bar(date, close_price - open_price, width=0.6, bottom=open_price, color=color)
-        
-        # 绘制上下影线
-        ax.vlines(date, low_price, high_price, color=color)
-        
-        # 高亮当前日期
-        if i == highlight_idx:
-            ax.bar(date, close_price - open_price, width=0.8, bottom=open_price, color='yellow', alpha=0.5)
-            ax.vlines(date, low_price, high_price, color='yellow', linewidth=2)
-    
+
+    # 窗口切片（_mdate在加载时已预计算）
+    dates = cols['_mdate'][start_idx:end_idx]
+    opens = cols['open'][start_idx:end_idx]
+    closes = cols['close'][start_idx:end_idx]
+    highs = cols['high'][start_idx:end_idx]
+    lows = cols['low'][start_idx:end_idx]
+
+    # 影线线段、实体顶点和涨跌掩码由JIT编译的单遍循环一次产出
+    wick_segments, body_verts, up_mask = _build_candle_arrays(dates, opens, closes, highs, lows)
+
+    # 上涨为绿色，下跌为红色：无分支掩码广播出打包RGBA，再归一化为matplotlib的0-1浮点
+    colors = np.where(up_mask[:, None], GREEN_RGBA, RED_RGBA) / 255.0
+
+    # 上下影线与实体各只占一个Collection
+    ax.add_collection(LineCollection(wick_segments, colors=colors, linewidths=1))
+    ax.add_collection(PolyCollection(body_verts, facecolors=colors, edgecolors=colors))
+
+    # 高亮当前日期（单独叠加两个artist，不在循环内逐行判断）
+    if highlight_idx is not None and 0 <= highlight_idx < len(dates):
+        ax.bar(dates[highlight_idx], closes[highlight_idx] - opens[highlight_idx],
+               width=0.8, bottom=opens[highlight_idx], color='yellow', alpha=0.5)
+        ax.vlines(dates[highlight_idx], lows[highlight_idx], highs[highlight_idx],
+                  color='yellow', linewidth=2)
+
+    # Collection不会自动更新坐标范围
+    ax.autoscale_view()
+
     # 设置X轴为日期格式
     ax.xaxis_date()
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
     plt.xticks(rotation=45)
     
     # 设置标题和标签
-    plt.title(f"股票K线图 ({plot_data['trade_date'].min().strftime('%Y-%m-%d')} 至 {plot_data['trade_date'].max().strftime('%Y-%m-%d')})")
+    trade_dates = cols['trade_date'][start_idx:end_idx]
+    plt.title(f"股票K线图 ({format_trade_date(trade_dates[0])} 至 {format_trade_date(trade_dates[-1])})")
     plt.xlabel('日期')
     plt.ylabel('价格 (元)')
     plt.grid(True, linestyle='--', alpha=0.7)
@@ -236,18 +379,17 @@ def main():
                 if uploaded_file is not None:
                     # 直接加载上传的文件，不保存到磁盘
                     try:
-                        df = pd.read_csv(uploaded_file)
-                        if 'trade_date' in df.columns:
-                            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-                            df = df.sort_values('trade_date')
-                            st.session_state.stock_data = df
-                            st.session_state.stock_data_loaded = True
-                            file_name = uploaded_file.name
-                            st.session_state.selected_file = file_name
-                            st.session_state.selected_stock_loaded = os.path.splitext(file_name)[0]
-                            st.success("数据加载成功！")
-                        else:
-                            st.error("数据文件中未找到'trade_date'列")
+                        df = pd.read_csv(uploaded_file, dtype={'trade_date': 'int32'})
+                        df = df.sort_values('trade_date')
+                        df['_mdate'] = mdates.date2num(pd.to_datetime(df['trade_date'], format='%Y%m%d').values)
+                        st.session_state.stock_data = df
+                        st.session_state.stock_data_loaded = True
+                        file_name = uploaded_file.name
+                        st.session_state.selected_file = file_name
+                        st.session_state.selected_stock_loaded = os.path.splitext(file_name)[0]
+                        st.success("数据加载成功！")
+                    except (KeyError, ValueError):
+                        st.error("数据文件中未找到'trade_date'列")
                     except Exception as e:
                         st.error(f"文件加载失败: {e}")
             else:
@@ -256,7 +398,7 @@ def main():
                 
                 if st.button("加载选中的股票"):
                     file_path = os.path.join(data_dir, selected_file)
-                    stock_data = load_stock_data(file_path)
+                    stock_data = load_stock_data(file_path, os.path.getmtime(file_path))
                     if not stock_data.empty:
                         st.session_state.stock_data = stock_data
                         st.session_state.stock_data_loaded = True
@@ -281,7 +423,7 @@ def main():
                     
                     # 自动加载随机选择的文件
                     file_path = os.path.join(data_dir, selected_file)
-                    stock_data = load_stock_data(file_path)
+                    stock_data = load_stock_data(file_path, os.path.getmtime(file_path))
                     if not stock_data.empty:
                         st.session_state.stock_data = stock_data
                         st.session_state.selected_file = selected_file
@@ -321,15 +463,22 @@ def main():
             # 交易费率
             commission_rate = st.slider("交易费率(%)", min_value=0.01, max_value=0.3, value=0.03, step=0.01) / 100
             
-            # 初始化交易模拟器
-            if 'trader' not in st.session_state:
-                st.session_state.trader = StockTrader(initial_capital, commission_rate)
+            # 初始化交易模拟器：按参数键重建——参数没变的rerun不碰trader，
+            # 参数变了但已开始交易时也不重建（否则滑杆抖动会悄悄清空交易历史）
+            trader_key = (initial_capital, commission_rate)
+            if st.session_state.get('trader_key') != trader_key:
+                if 'trader' not in st.session_state or not st.session_state.trader.has_buy_transaction():
+                    st.session_state.trader = StockTrader(initial_capital, commission_rate)
+                    st.session_state.last_recorded_day = None  # 新模拟器重新记录当日状态
+                st.session_state.trader_key = trader_key
             
             # 重置按钮
             if st.button("重置模拟器"):
                 st.session_state.trader = StockTrader(initial_capital, commission_rate)
                 st.session_state.current_day = 499  # 初始显示第1-500条数据
                 st.session_state.buy_executed = False  # 重置买入标记
+                st.session_state.trader_key = (initial_capital, commission_rate)
+                st.session_state.last_recorded_day = None  # 让重置后的第一天重新记录
                 st.success("模拟器已重置")
     
     # 主界面逻辑 (仅在数据加载后显示)
@@ -338,6 +487,16 @@ def main():
         selected_stock = st.session_state.selected_stock_loaded
         total_days = len(stock_data)
         
+        # 列数组视图只在数据对象变化时提取一次，之后每次rerun的窗口/单日读取都走NumPy切片。
+        # 按对象身份而非股票名作键：同名股票刷新重载后是新DataFrame，旧数组必须跟着换掉
+        if st.session_state.get('stock_cols_for') != id(stock_data):
+            st.session_state.stock_cols = {
+                c: stock_data[c].to_numpy()
+                for c in ('open', 'high', 'low', 'close', '_mdate', 'trade_date')
+            }
+            st.session_state.stock_cols_for = id(stock_data)
+        cols = st.session_state.stock_cols
+        
         # 初始化当前日期索引（调整为从第500条数据开始）
         if 'current_day' not in st.session_state:
             st.session_state.current_day = min(499, total_days - 1)  # 初始显示第1-500条，或全部数据
@@ -361,11 +520,10 @@ def main():
             end_idx = total_days
             current_day = total_days - 1
         
-        # 获取当前日期数据
+        # 获取当前日期数据（直接索引缓存的列数组，不构建iloc行对象）
         if current_day < total_days:
-            current_data = stock_data.iloc[current_day]
-            current_date = current_data['trade_date'].strftime('%Y-%m-%d')
-            current_price = current_data['close']
+            current_date = format_trade_date(cols['trade_date'][current_day])
+            current_price = cols['close'][current_day]
         else:
             current_date = "数据已结束"
             current_price = 0
@@ -375,13 +533,19 @@ def main():
         col1.metric("当前日期", current_date)
         col1.metric("当前价格", f"{current_price:.2f}元")
         
-        # 记录每日状态
+        # 记录每日状态（只在交易日前进时追加一条；普通控件触发的rerun直接复用上次指标，
+        # 否则daily_state会被每次rerun无限追加，累积收益曲线也会被污染）
         if current_day < total_days:
-            daily_return, cumulative_return = st.session_state.trader.record_daily_state(
-                current_date, current_price
-            )
-            col2.metric("当日收益率", f"{daily_return:.2f}%")
-            col2.metric("累积收益率", f"{cumulative_return:.2f}%")
+            record_key = (selected_stock, current_day)
+            if st.session_state.get('last_recorded_day') != record_key:
+                daily_return, cumulative_return = st.session_state.trader.record_daily_state(
+                    current_date, current_price
+                )
+                st.session_state.last_recorded_day = record_key
+                st.session_state.last_daily_return = daily_return
+                st.session_state.last_cumulative_return = cumulative_return
+            col2.metric("当日收益率", f"{st.session_state.last_daily_return:.2f}%")
+            col2.metric("累积收益率", f"{st.session_state.last_cumulative_return:.2f}%")
             
             current_value = st.session_state.trader.get_current_portfolio_value(current_price)
             col3.metric("当前总资产", f"{current_value:.2f}元")
@@ -395,7 +559,7 @@ def main():
         # 绘制K线图
         st.subheader(f"股票K线图 (第{start_idx+1}至第{end_idx}个交易日)")
         if end_idx > start_idx:
-            fig = plot_candlestick(stock_data, start_idx, end_idx, current_day - start_idx)
+            fig = plot_candlestick(cols, start_idx, end_idx, current_day - start_idx)
             st.pyplot(fig)
         else:
             st.info("数据不足，无法绘制K线图")
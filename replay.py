@@ -0,0 +1,30 @@
+'''
+全历史回放的计算核心。装有Numba时JIT编译为原生单遍循环，
+未安装时退化为普通Python函数，结果完全一致只是更慢。
+'''
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba为可选依赖，缺失时njit退化为空装饰器
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True)
+def replay_daily_state(prices, capitals, shares, initial_capital):
+    """单遍重算每日收益率、累积收益率和组合市值三个数组"""
+    n = prices.shape[0]
+    daily_return = np.zeros(n)
+    cumulative_return = np.empty(n)
+    portfolio_value = np.empty(n)
+    for i in range(n):
+        portfolio_value[i] = capitals[i] + shares[i] * prices[i]
+        if i > 0:
+            daily_return[i] = (prices[i] / prices[i - 1] - 1) * 100
+        cumulative_return[i] = (portfolio_value[i] / initial_capital - 1) * 100
+    return daily_return, cumulative_return, portfolio_value
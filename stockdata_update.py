@@ -3,15 +3,47 @@
 '''
 import tushare as ts
 import pandas as pd
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
 
 pro = ts.pro_api('f95df333fd3fe823d921ae41e676147c44b397743b3f74de81e3e7f8')
 start_date='20180101'#起始日期可自定义,没必要用太早的数据
 stock_list = pd.read_excel("stocklist.xlsx")
 
-for stockcode in stock_list['ts_code']:
+MAX_WORKERS = 8          # 下载为I/O密集，多线程重叠网络等待
+CALLS_PER_MINUTE = 480   # tushare每分钟调用上限，按自己账号的积分档位调整
+
+# 令牌桶限速：每次API调用消耗一个令牌，后台线程按固定速率补充。
+# 桶容量只有MAX_WORKERS：启动时放不出整分钟的突发，慢速阶段也不会无限攒令牌
+_tokens = threading.BoundedSemaphore(MAX_WORKERS)
+
+def _refill_tokens():
+    while True:
+        time.sleep(60 / CALLS_PER_MINUTE)
+        try:
+            _tokens.release()
+        except ValueError:
+            pass  # 桶已满，丢弃本次令牌
+
+threading.Thread(target=_refill_tokens, daemon=True).start()
+
+def fetch(stockcode):
+    _tokens.acquire()
     temp_data = pro.daily(ts_code=stockcode, start_date=start_date, end_date=date.today().strftime('%Y%m%d'))
-    temp_data.to_csv(f'stockdata/{stockcode[:6]}.csv',index=False)#A股代码均为六位
-    time.sleep(0.1)
-    print(f'{stockcode} complete')
\ No newline at end of file
+    return stockcode, temp_data
+
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    futures = {executor.submit(fetch, stockcode): stockcode for stockcode in stock_list['ts_code']}
+    for future in as_completed(futures):
+        stockcode = futures[future]
+        try:
+            _, temp_data = future.result()
+            # 入库时按int32的YYYYMMDD存日期并排序，直接写Parquet（读取比CSV快一个量级以上）
+            temp_data['trade_date'] = temp_data['trade_date'].astype('int32')
+            temp_data = temp_data.sort_values('trade_date')
+            temp_data.to_parquet(f'stockdata/{stockcode[:6]}.parquet', engine='pyarrow', compression='zstd', index=False)#A股代码均为六位
+            print(f'{stockcode} complete')
+        except Exception as e:
+            print(f'{stockcode} failed: {e}')  # 单只失败不中断整轮刷新